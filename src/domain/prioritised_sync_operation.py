@@ -0,0 +1,11 @@
+from datetime import timedelta
+from typing import NamedTuple
+from pydantic import UUID4
+from domain.sync_operation_type import SyncOperationType
+from models.unavailability import Unavailability
+
+class PrioritisedSyncOperation(NamedTuple):
+    distance_to_now: timedelta
+    resource_id: UUID4
+    operation: SyncOperationType
+    unavailability: Unavailability
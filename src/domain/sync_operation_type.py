@@ -0,0 +1,6 @@
+from enum import Enum
+
+class SyncOperationType(Enum):
+    CREATE = "CREATE"
+    UPDATE = "UPDATE"
+    DELETE = "DELETE"
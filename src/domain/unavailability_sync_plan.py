@@ -1,9 +1,10 @@
 from typing import NamedTuple, Deque
 from typing import Deque
 
+from domain.unavailability_update import UnavailabilityUpdate
 from models.unavailability import Unavailability
 
 class UnavailabilitySyncPlan(NamedTuple):
     to_create: Deque[Unavailability]
-    to_update: Deque[Unavailability]
+    to_update: Deque[UnavailabilityUpdate]
     to_delete: Deque[Unavailability]
\ No newline at end of file
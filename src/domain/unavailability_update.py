@@ -0,0 +1,6 @@
+from typing import NamedTuple
+from models.unavailability import Unavailability
+
+class UnavailabilityUpdate(NamedTuple):
+    unavailability: Unavailability
+    current_unavailability: Unavailability
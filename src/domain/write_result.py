@@ -0,0 +1,10 @@
+from typing import NamedTuple, Optional
+from domain.write_status import WriteStatus
+
+class WriteResult(NamedTuple):
+    status: WriteStatus
+    failure_reason: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == WriteStatus.SUCCEEDED
@@ -0,0 +1,6 @@
+from enum import Enum
+
+class WriteStatus(Enum):
+    SUCCEEDED = "SUCCEEDED"
+    RETRYABLE_FAILURE = "RETRYABLE_FAILURE"
+    PERMANENT_FAILURE = "PERMANENT_FAILURE"
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 from typing import Any, Dict
 from apscheduler.executors.pool import ThreadPoolExecutor
@@ -29,20 +29,35 @@ logger = logging.getLogger(__name__)
 
 def run_sync_job():
     START_YEAR = get_env_var("START_YEAR")
+    SYNC_TIME_BUDGET_SECONDS = get_env_var("SYNC_TIME_BUDGET_SECONDS")
     logger.info("Scheduler triggered synchronization job...")
     try:
         start_time_filter = datetime(year=int(START_YEAR), month=1, day=1)
-        sync_service = SynchronisationService(start_time=start_time_filter)
+        time_budget = timedelta(seconds=int(SYNC_TIME_BUDGET_SECONDS)) if int(SYNC_TIME_BUDGET_SECONDS) > 0 else None
+        sync_service = SynchronisationService(start_time=start_time_filter, time_budget=time_budget)
         sync_service.synchronize_unavailabilities()
         logger.info("Synchronization job completed successfully.")
     except Exception as e:
         logger.exception(f"An error occurred during the scheduled sync job: {e}")
 
+def run_retry_job():
+    START_YEAR = get_env_var("START_YEAR")
+    logger.info("Scheduler triggered retry job...")
+    try:
+        start_time_filter = datetime(year=int(START_YEAR), month=1, day=1)
+        sync_service = SynchronisationService(start_time=start_time_filter)
+        sync_service.retry_failed_operations()
+        logger.info("Retry job completed successfully.")
+    except Exception as e:
+        logger.exception(f"An error occurred during the scheduled retry job: {e}")
+
 if __name__ == "__main__":
     SYNC_CRON_SCHEDULE = get_env_var("SYNC_CRON_SCHEDULE")
+    RETRY_CRON_SCHEDULE = get_env_var("RETRY_CRON_SCHEDULE")
     logger.info("=============================================")
     logger.info(" Starting APScheduler for Qargo Sync Service ")
     logger.info(f" Schedule: CRON '{SYNC_CRON_SCHEDULE}'")
+    logger.info(f" Retry schedule: CRON '{RETRY_CRON_SCHEDULE}'")
     logger.info("=============================================")
 
     jobstores = {
@@ -75,6 +90,14 @@ if __name__ == "__main__":
             replace_existing=True
         )
 
+        scheduler.add_job( # type: ignore
+            run_retry_job,
+            trigger=CronTrigger.from_crontab(RETRY_CRON_SCHEDULE, timezone=utc), # type: ignore
+            id='qargo_retry_job',
+            name='Qargo Failed Operation Retry',
+            replace_existing=True
+        )
+
         logger.info("Scheduler started. Press Ctrl+C to exit.")
 
         scheduler.start() # type: ignore
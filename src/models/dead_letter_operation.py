@@ -0,0 +1,26 @@
+from datetime import datetime
+from pydantic import BaseModel, UUID4
+from domain.sync_operation_type import SyncOperationType
+from models.retry_operation import RetryOperation
+from models.unavailability import Unavailability
+
+class DeadLetterOperation(BaseModel):
+    target: str
+    resource_id: UUID4
+    operation: SyncOperationType
+    unavailability: Unavailability
+    attempts: int
+    failure_reason: str
+    failed_time: datetime
+
+    @classmethod
+    def from_retry_operation(cls, retry_operation: RetryOperation, failure_reason: str, failed_time: datetime) -> "DeadLetterOperation":
+        return cls(
+            target=retry_operation.target,
+            resource_id=retry_operation.resource_id,
+            operation=retry_operation.operation,
+            unavailability=retry_operation.unavailability,
+            attempts=retry_operation.attempts,
+            failure_reason=failure_reason,
+            failed_time=failed_time,
+        )
@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta
+from pydantic import BaseModel, UUID4
+from domain.sync_operation_type import SyncOperationType
+from models.unavailability import Unavailability
+
+class RetryOperation(BaseModel):
+    target: str
+    resource_id: UUID4
+    operation: SyncOperationType
+    unavailability: Unavailability
+    # Priority the operation had in its sync plan, so retries keep the same order (e.g. updates on their nearest period)
+    distance_to_now: timedelta
+    attempts: int
+    next_attempt_time: datetime
+    last_failure_reason: str
+
+    @staticmethod
+    def build_key(target: str, resource_id: UUID4, operation: SyncOperationType, unavailability: Unavailability) -> str:
+        return f"{target}:{operation.value}:{resource_id}:{unavailability.id}"
+
+    @property
+    def key(self) -> str:
+        return RetryOperation.build_key(self.target, self.resource_id, self.operation, self.unavailability)
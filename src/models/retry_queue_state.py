@@ -0,0 +1,8 @@
+from typing import List
+from pydantic import BaseModel
+from models.dead_letter_operation import DeadLetterOperation
+from models.retry_operation import RetryOperation
+
+class RetryQueueState(BaseModel):
+    pending: List[RetryOperation] = []
+    dead_letters: List[DeadLetterOperation] = []
@@ -1,8 +1,9 @@
 from typing import Optional
 from pydantic import BaseModel, UUID4
-from datetime import datetime
+from datetime import datetime, timedelta
 from domain.unavailability_reason import UnavailabilityReason
 from dtos.unavailability_dto import UnavailabilityDto
+from utils.utils import as_utc
 
 class Unavailability(BaseModel):
     id: UUID4
@@ -30,3 +31,13 @@ class Unavailability(BaseModel):
             self.reason == other.reason and
             self.description == other.description
         )
+
+    def distance_to(self, now: datetime) -> timedelta:
+        start_time = as_utc(self.start_time)
+        end_time = as_utc(self.end_time) if self.end_time else None
+        if start_time > now:
+            return start_time - now
+        if end_time and end_time < now:
+            return now - end_time
+        # Ongoing unavailabilities are the most urgent
+        return timedelta(0)
@@ -1,9 +1,13 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from http import HTTPMethod
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Type, TypeVar
 import logging
-from pydantic import UUID4, ValidationError
+import threading
+from pydantic import UUID4, BaseModel, ValidationError
 import requests
+from domain.write_result import WriteResult
+from domain.write_status import WriteStatus
 from dtos.resource_list_dto import ResourceListDto
 from dtos.unavailability_dto import UnavailabilityDto
 from dtos.unavailability_list_dto import UnavailabilityListDto
@@ -16,21 +20,32 @@ from utils.utils import get_env_var, with_exponential_backoff
 
 logger = logging.getLogger(__name__)
 
+ListDtoT = TypeVar("ListDtoT", bound=BaseModel)
+
 class QargoAPIClient:
     _api_client_id: str
     _api_client_secret: str
     _api_url: str
+    _page_size: Optional[int]
     _session: requests.Session
+    _read_ahead_executor: Optional[ThreadPoolExecutor] = None
+    _read_ahead_executor_lock: threading.Lock
     _access_token: Optional[str] = None
     _access_token_expiry_time: Optional[datetime] = None
     
-    def __init__(self, api_client_id: str, api_client_secret: str, api_url: str):
+    def __init__(self, api_client_id: str, api_client_secret: str, api_url: str, page_size: Optional[int] = None):
         if not api_client_id or not api_client_secret:
             raise ValueError("API client id and secret are required.")
         self._api_client_id = api_client_id
         self._api_client_secret = api_client_secret
         self._api_url = api_url
+        self._page_size = page_size
         self._session = requests.Session()
+        self._read_ahead_executor_lock = threading.Lock()
+
+    @property
+    def client_id(self) -> str:
+        return self._api_client_id
 
     @with_exponential_backoff()
     def _call_api(self, method: HTTPMethod, 
@@ -88,137 +103,181 @@ class QargoAPIClient:
             raise ConnectionError("Unable to fetch access token.")
         return self._access_token
 
-    def get_resources(self):
-        all_resources: List[Resource] = []
-        next_cursor: Optional[str] = None
-        page_number = 1
-
+    def _paginate(self, uri: str, params: Dict[str, str | None], list_dto_type: Type[ListDtoT]) -> Iterator[ListDtoT]:
+        page_params: Dict[str, str | None] = {**params, **({"limit": str(self._page_size)} if self._page_size else {})}
+        response = self._call_api(method=HTTPMethod.GET, uri=uri, params={**page_params, "cursor": None})
         while True:
-            try:
-                response = self._call_api(method=HTTPMethod.GET, uri= "/resources/resource", params= {"cursor": next_cursor})
+            json = response.json()
+            if not isinstance(json, dict):
+                # Let the dto report the malformed body, so it is handled like any other validation error
+                list_dto_type.model_validate(json)
+            next_cursor = json.get("next_cursor")
+            if not next_cursor:
+                yield list_dto_type.model_validate(json)
+                return
+            # Request the next page as soon as its cursor is known, so it downloads while the current page is validated
+            next_page: Future[requests.Response] = self._get_read_ahead_executor().submit(
+                self._call_api, method=HTTPMethod.GET, uri=uri, params={**page_params, "cursor": next_cursor})
+            yield list_dto_type.model_validate(json)
+            response = next_page.result()
 
-                json = response.json()
-                resource_list_dto = ResourceListDto.model_validate(json)
+    def _get_read_ahead_executor(self) -> ThreadPoolExecutor:
+        with self._read_ahead_executor_lock:
+            if self._read_ahead_executor is None:
+                self._read_ahead_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="read-ahead")
+            return self._read_ahead_executor
 
-                all_resources.extend([Resource.from_resource_dto(dto) for dto in resource_list_dto.items])
+    def get_resources(self) -> Iterator[Resource]:
+        resource_count = 0
+        page_number = 0
 
-                if resource_list_dto.next_cursor:
-                    next_cursor = resource_list_dto.next_cursor
-                    page_number += 1
-                else:
-                    break
+        try:
+            for resource_list_dto in self._paginate(uri= "/resources/resource", params= {}, list_dto_type= ResourceListDto):
+                page_number += 1
+                for dto in resource_list_dto.items:
+                    resource_count += 1
+                    yield Resource.from_resource_dto(dto)
                 
-            except requests.exceptions.RequestException as e:
-                logger.exception(f"Error requesting resources: {e}")
-                raise e
-            except ValidationError as e:
-                logger.exception(f"Error parsing ResourceListDto: {e}")
-                raise e
-            except Exception as e:
-                logger.exception(f"Unexpected exception: {e}")
-                raise e
-        logger.info(f"Successfully retrieved a total of {len(all_resources)} resources across {page_number} page(s).")
-        return all_resources
+        except requests.exceptions.RequestException as e:
+            logger.exception(f"Error requesting resources: {e}")
+            raise e
+        except ValidationError as e:
+            logger.exception(f"Error parsing ResourceListDto: {e}")
+            raise e
+        except Exception as e:
+            logger.exception(f"Unexpected exception: {e}")
+            raise e
+        logger.info(f"Successfully retrieved a total of {resource_count} resources across {page_number} page(s).")
     
-    def get_unavailabilities(self, resource_id: UUID4, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> List[Unavailability]:
-        all_unavailabilities: List[Unavailability] = []
-        next_cursor: Optional[str] = None
-        page_number = 1
+    def get_unavailabilities(self, resource_id: UUID4, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> Iterator[Unavailability]:
+        unavailability_count = 0
+        page_number = 0
 
-        while True:
-            try:
-                response = self._call_api(method=HTTPMethod.GET, 
-                                          uri= f"/resources/resource/{str(resource_id)}/unavailability", 
-                                          params= {"cursor": next_cursor, 
-                                                   **({"start_time": start_time.isoformat()} if start_time else {}),
-                                                   **({"end_time": end_time.isoformat()} if end_time else {})})
-
-                json = response.json()
-                unavailability_list_dto = UnavailabilityListDto.model_validate(json)
-
-                all_unavailabilities.extend([Unavailability.from_unavailability_dto(dto) for dto in unavailability_list_dto.items])
-
-                if unavailability_list_dto.next_cursor:
-                    next_cursor = unavailability_list_dto.next_cursor
-                    page_number += 1
-                else:
-                    break
+        try:
+            for unavailability_list_dto in self._paginate(uri= f"/resources/resource/{str(resource_id)}/unavailability", 
+                                                          params= {**({"start_time": start_time.isoformat()} if start_time else {}),
+                                                                   **({"end_time": end_time.isoformat()} if end_time else {})},
+                                                          list_dto_type= UnavailabilityListDto):
+                page_number += 1
+                for dto in unavailability_list_dto.items:
+                    unavailability_count += 1
+                    yield Unavailability.from_unavailability_dto(dto)
                 
-            except requests.exceptions.RequestException as e:
-                logger.exception(f"Error requesting unavailabilities: {e}")
-                raise e
-            except ValidationError as e:
-                logger.exception(f"Error parsing UnavailabilityListDto: {e}")
-                raise e
-            except Exception as e:
-                logger.exception(f"Unexpected exception: {e}")
-                raise e
-        logger.info(f"Successfully retrieved a total of {len(all_unavailabilities)} unavailabilities across {page_number} page(s).")
-        return all_unavailabilities
+        except requests.exceptions.RequestException as e:
+            logger.exception(f"Error requesting unavailabilities: {e}")
+            raise e
+        except ValidationError as e:
+            logger.exception(f"Error parsing UnavailabilityListDto: {e}")
+            raise e
+        except Exception as e:
+            logger.exception(f"Unexpected exception: {e}")
+            raise e
+        logger.info(f"Successfully retrieved a total of {unavailability_count} unavailabilities across {page_number} page(s).")
     
-    def create_unavailability(self, resource_id: UUID4, unavailability: Unavailability) -> bool:
+    def create_unavailability(self, resource_id: UUID4, unavailability: Unavailability) -> WriteResult:
         try:
             unavailability_post_dto = UnavailabilityPostDto.from_unavailability(unavailability=unavailability)
             logger.debug(unavailability_post_dto.model_dump_json())
             response = self._call_api(method=HTTPMethod.POST, 
                                       uri= f"/resources/resource/{str(resource_id)}/unavailability",
                                       body=unavailability_post_dto.model_dump_json())
-
-            json = response.json()
-            UnavailabilityDto.model_validate(json)
-            return True
         
         except requests.exceptions.RequestException as e:
             logger.exception(f"Error posting unavailability: {e}")
-        except ValidationError as e:
-            logger.exception(f"Error parsing UnavailabilityDto: {e}")
-            raise e
+            return self._to_failed_write_result(e)
         except Exception as e:
             logger.exception(f"Unexpected exception: {e}")
-        return False
+            return self._to_failed_write_result(e)
+        self._validate_write_response(response)
+        return WriteResult(WriteStatus.SUCCEEDED)
     
-    def update_unavailability(self, resource_id: UUID4, unavailability: Unavailability) -> bool:
+    def update_unavailability(self, resource_id: UUID4, unavailability: Unavailability) -> WriteResult:
         try:
             unavailability_put_dto = UnavailabilityPutDto.from_unavailability(unavailability=unavailability)
             response = self._call_api(method=HTTPMethod.PUT, 
                                       uri= f"/resources/resource/{str(resource_id)}/unavailability/{str(unavailability.id)}",
                                       body=unavailability_put_dto.model_dump())
-            json = response.json()
-            UnavailabilityDto.model_validate(json)
-            return True
             
         except requests.exceptions.RequestException as e:
             logger.exception(f"Error updating unavailability: {e}")
-        except ValidationError as e:
-            logger.exception(f"Error parsing UnavailabilityDto: {e}")
-            raise e
+            return self._to_failed_write_result(e)
         except Exception as e:
             logger.exception(f"Unexpected exception: {e}")
-        return False
+            return self._to_failed_write_result(e)
+        self._validate_write_response(response)
+        return WriteResult(WriteStatus.SUCCEEDED)
     
-    def delete_unavailability(self, id: UUID4, resource_id: UUID4) -> bool:
+    def delete_unavailability(self, id: UUID4, resource_id: UUID4) -> WriteResult:
         try:
             self._call_api(method=HTTPMethod.DELETE, 
                                       uri= f"/resources/resource/{str(resource_id)}/unavailability/{str(id)}")
-            return True
+            return WriteResult(WriteStatus.SUCCEEDED)
             
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                logger.info(f"Unavailability {id} for resource {resource_id} was already deleted.")
+                return WriteResult(WriteStatus.SUCCEEDED)
+            logger.exception(f"Error deleting unavailability: {e}")
+            return self._to_failed_write_result(e)
         except requests.exceptions.RequestException as e:
             logger.exception(f"Error deleting unavailability: {e}")
+            return self._to_failed_write_result(e)
         except Exception as e:
             logger.exception(f"Unexpected exception: {e}")
-        return False
+            return self._to_failed_write_result(e)
+
+    def _validate_write_response(self, response: requests.Response):
+        try:
+            UnavailabilityDto.model_validate(response.json())
+        except (requests.exceptions.JSONDecodeError, ValidationError) as e:
+            # The write itself was accepted, so an unexpected response body must not cause it to be retried
+            logger.exception(f"Error parsing UnavailabilityDto: {e}")
+
+    @staticmethod
+    def _to_failed_write_result(e: Exception) -> WriteResult:
+        if isinstance(e, RateLimitException):
+            return WriteResult(WriteStatus.RETRYABLE_FAILURE, str(e))
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+            status_code = e.response.status_code
+            failure_reason = f"HTTP {status_code} {e.response.reason}: {e.response.text[:500]}"
+            # Rate limits, timeouts, server errors and authentication problems of the target may resolve by themselves,
+            # other client errors are caused by the operation itself and will not
+            if status_code in (401, 403, 408, 429) or status_code >= 500:
+                return WriteResult(WriteStatus.RETRYABLE_FAILURE, failure_reason)
+            return WriteResult(WriteStatus.PERMANENT_FAILURE, failure_reason)
+        if isinstance(e, (requests.exceptions.RequestException, ConnectionError)):
+            return WriteResult(WriteStatus.RETRYABLE_FAILURE, f"{type(e).__name__}: {e}")
+        return WriteResult(WriteStatus.PERMANENT_FAILURE, f"{type(e).__name__}: {e}")
     
 
-target_qargo_api_client = QargoAPIClient(
-    api_client_id=get_env_var("API_CLIENT_ID"),
-    api_client_secret=get_env_var("API_CLIENT_SECRET"),
-    api_url=get_env_var("API_URL")
-)
+def _get_page_size() -> Optional[int]:
+    # 0 leaves the page size up to the API
+    page_size = int(get_env_var("API_PAGE_SIZE"))
+    return page_size if page_size > 0 else None
+
+def _create_target_qargo_api_clients() -> List[QargoAPIClient]:
+    # Multiple target environments are configured as comma separated, positionally matched ids and secrets
+    api_client_ids = [api_client_id.strip() for api_client_id in get_env_var("API_CLIENT_ID").split(",")]
+    api_client_secrets = [api_client_secret.strip() for api_client_secret in get_env_var("API_CLIENT_SECRET").split(",")]
+    if len(api_client_ids) != len(api_client_secrets):
+        raise ValueError("API_CLIENT_ID and API_CLIENT_SECRET must contain the same number of comma separated values.")
+    return [
+        QargoAPIClient(
+            api_client_id=api_client_id,
+            api_client_secret=api_client_secret,
+            api_url=get_env_var("API_URL"),
+            page_size=_get_page_size()
+        )
+        for api_client_id, api_client_secret in zip(api_client_ids, api_client_secrets)
+    ]
+
+target_qargo_api_clients = _create_target_qargo_api_clients()
 
 master_qargo_api_client = QargoAPIClient(
     api_client_id=get_env_var("MASTER_API_CLIENT_ID"),
     api_client_secret=get_env_var("MASTER_API_CLIENT_SECRET"),
-    api_url=get_env_var("API_URL")
+    api_url=get_env_var("API_URL"),
+    page_size=_get_page_size()
 )
 
     
\ No newline at end of file
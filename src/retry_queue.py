@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Set
+from pydantic import UUID4, ValidationError
+from domain.sync_operation_type import SyncOperationType
+from models.dead_letter_operation import DeadLetterOperation
+from models.retry_operation import RetryOperation
+from models.retry_queue_state import RetryQueueState
+from models.unavailability import Unavailability
+from utils.utils import get_env_var
+
+logger = logging.getLogger(__name__)
+
+class RetryQueue:
+    _file_path: str
+    _max_attempts: int
+    _base_delay: float
+    _max_delay: float
+    _pending: Dict[str, RetryOperation]
+    _dead_letters: List[DeadLetterOperation]
+    _lock: threading.Lock
+
+    def __init__(self, file_path: str, max_attempts: int = 5, base_delay: float = 60.0, max_delay: float = 3600.0):
+        if max_attempts < 1:
+            raise ValueError("Retry queue max attempts must be at least 1.")
+        self._file_path = file_path
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        state = RetryQueueState()
+        if os.path.exists(self._file_path):
+            try:
+                with open(self._file_path, "r", encoding="utf-8") as file:
+                    state = RetryQueueState.model_validate_json(file.read())
+            except (OSError, ValidationError) as e:
+                logger.exception(f"Error loading retry queue from {self._file_path}: {e}")
+                raise e
+        self._pending = {operation.key: operation for operation in state.pending}
+        self._dead_letters = state.dead_letters
+        logger.info(f"Loaded retry queue with {len(self._pending)} pending and {len(self._dead_letters)} dead-lettered operation(s).")
+
+    def _save(self):
+        state = RetryQueueState(pending=list(self._pending.values()), dead_letters=self._dead_letters)
+        directory = os.path.dirname(self._file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Write to a temporary file first so a crash mid-write never corrupts the queue
+        temporary_file_path = f"{self._file_path}.tmp"
+        with open(temporary_file_path, "w", encoding="utf-8") as file:
+            file.write(state.model_dump_json(indent=2))
+        os.replace(temporary_file_path, self._file_path)
+
+    def _backoff_delay(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(self._base_delay * 2 ** (attempts - 1), self._max_delay))
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def due_operations(self, now: Optional[datetime] = None) -> List[RetryOperation]:
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            return [operation for operation in self._pending.values() if operation.next_attempt_time <= now]
+
+    def record_failure(self, target: str, resource_id: UUID4, operation: SyncOperationType, unavailability: Unavailability, distance_to_now: timedelta, reason: str):
+        now = datetime.now(timezone.utc)
+        key = RetryOperation.build_key(target, resource_id, operation, unavailability)
+        with self._lock:
+            existing_operation = self._pending.get(key)
+            attempts = existing_operation.attempts + 1 if existing_operation else 1
+            retry_operation = RetryOperation(
+                target=target,
+                resource_id=resource_id,
+                operation=operation,
+                unavailability=unavailability,
+                distance_to_now=distance_to_now,
+                attempts=attempts,
+                next_attempt_time=now + self._backoff_delay(attempts),
+                last_failure_reason=reason,
+            )
+            if attempts >= self._max_attempts:
+                logger.error(f"[{target}] Giving up on {operation.value} of unavailability {unavailability.id} for resource {resource_id} after {attempts} attempt(s).")
+                self._pending.pop(key, None)
+                self._dead_letters.append(DeadLetterOperation.from_retry_operation(
+                    retry_operation,
+                    failure_reason=f"Max attempts ({self._max_attempts}) reached: {reason}",
+                    failed_time=now))
+            else:
+                logger.info(f"[{target}] Queued {operation.value} of unavailability {unavailability.id} for resource {resource_id} for retry at {retry_operation.next_attempt_time.isoformat()} (attempt {attempts}).")
+                self._pending[key] = retry_operation
+            self._save()
+
+    def record_permanent_failure(self, target: str, resource_id: UUID4, operation: SyncOperationType, unavailability: Unavailability, reason: str):
+        now = datetime.now(timezone.utc)
+        key = RetryOperation.build_key(target, resource_id, operation, unavailability)
+        with self._lock:
+            existing_operation = self._pending.pop(key, None)
+            attempts = existing_operation.attempts + 1 if existing_operation else 1
+            logger.error(f"[{target}] Dead-lettering {operation.value} of unavailability {unavailability.id} for resource {resource_id}: {reason}")
+            self._dead_letters.append(DeadLetterOperation(
+                target=target,
+                resource_id=resource_id,
+                operation=operation,
+                unavailability=unavailability,
+                attempts=attempts,
+                failure_reason=reason,
+                failed_time=now))
+            self._save()
+
+    def dead_letter(self, retry_operation: RetryOperation, reason: str):
+        with self._lock:
+            logger.error(f"[{retry_operation.target}] Dead-lettering {retry_operation.operation.value} of unavailability {retry_operation.unavailability.id} for resource {retry_operation.resource_id}: {reason}")
+            self._pending.pop(retry_operation.key, None)
+            self._dead_letters.append(DeadLetterOperation.from_retry_operation(
+                retry_operation,
+                failure_reason=reason,
+                failed_time=datetime.now(timezone.utc)))
+            self._save()
+
+    def reconcile(self, target: str, planned_keys: Set[str]):
+        # The latest diff is authoritative: pending operations it no longer plans are stale and must not be replayed
+        with self._lock:
+            stale_keys = [key for key, operation in self._pending.items() if operation.target == target and key not in planned_keys]
+            for key in stale_keys:
+                del self._pending[key]
+            if stale_keys:
+                logger.info(f"[{target}] Removed {len(stale_keys)} pending operation(s) that are no longer part of the sync plan.")
+                self._save()
+
+    def discard(self, target: str, resource_id: UUID4, operation: SyncOperationType, unavailability: Unavailability):
+        key = RetryOperation.build_key(target, resource_id, operation, unavailability)
+        with self._lock:
+            if self._pending.pop(key, None) is not None:
+                logger.debug(f"Removed {key} from retry queue.")
+                self._save()
+
+
+retry_queue = RetryQueue(
+    file_path=get_env_var("RETRY_QUEUE_FILE"),
+    max_attempts=int(get_env_var("RETRY_MAX_ATTEMPTS"))
+)
@@ -1,48 +1,116 @@
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import logging
-from typing import Deque, Dict, List
+import time
+from typing import Callable, Deque, Dict, List, Optional, TypeVar
 from pydantic import UUID4
+from domain.prioritised_sync_operation import PrioritisedSyncOperation
 from domain.unavailability_groups import UnavailabilityGroups
 from domain.unavailability_sync_plan import UnavailabilitySyncPlan
+from domain.unavailability_update import UnavailabilityUpdate
+from domain.sync_operation_type import SyncOperationType
+from domain.write_status import WriteStatus
+from models.retry_operation import RetryOperation
 from models.unavailability import Unavailability
-from qargo_api_client import master_qargo_api_client, target_qargo_api_client
+from qargo_api_client import QargoAPIClient, master_qargo_api_client, target_qargo_api_clients
+from retry_queue import retry_queue
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 class SynchronisationService:
 
     _start_time: datetime
+    _time_budget: Optional[timedelta]
+    _target_api_clients: List[QargoAPIClient]
 
-    def __init__(self, start_time: datetime):
+    def __init__(self, start_time: datetime, time_budget: Optional[timedelta] = None, target_api_clients: Optional[List[QargoAPIClient]] = None):
         self._start_time = start_time
+        self._time_budget = time_budget
+        self._target_api_clients = target_api_clients or target_qargo_api_clients
+        if len({target_api_client.client_id for target_api_client in self._target_api_clients}) != len(self._target_api_clients):
+            raise ValueError("Target API clients must have distinct client ids.")
 
     def synchronize_unavailabilities(self):
-        logger.info("Loading resources...")
-        resource_ids = self._load_resource_ids()
-        logger.info(f"Loaded {len(resource_ids)} resources.")
-        
-        logger.info("Loading unavailabilities for resources...")
-        unavailability_groups_by_resource_id = self._load_unavailabilities_for_resources(resource_ids)
-        logger.info("Finished loading unavailabilities.")
-        
-        for resource_id, unavailability_groups in unavailability_groups_by_resource_id.items():
-            logger.info(f"Determining sync plan for resource {resource_id}...")
-            sync_plan = self._determine_unavailability_sync_plan(unavailability_groups=unavailability_groups)
+        self.retry_failed_operations()
+
+        logger.info(f"Loading resources for {len(self._target_api_clients)} target(s)...")
+        resource_ids_by_target = self._run_for_targets(self._target_api_clients, self._load_resource_ids)
+        if not resource_ids_by_target:
+            raise ConnectionError("Failed to load resources for every target.")
+        resource_ids = list(dict.fromkeys(resource_id for target_resource_ids in resource_ids_by_target.values() for resource_id in target_resource_ids))
+        logger.info(f"Loaded {len(resource_ids)} distinct resources.")
 
-            logger.info(f"Executing sync plan actions for resource {resource_id}...")
-            self._execute_unavailability_sync_plan_for_resource(resource_id, sync_plan)
-            logger.info(f"Finished executing sync plan actions for resource {resource_id}.")
+        logger.info("Loading master unavailabilities for resources...")
+        master_unavailabilities_by_resource_id = self._load_master_unavailabilities(resource_ids)
+        logger.info("Finished loading master unavailabilities.")
+
+        loaded_target_api_clients = [target_api_client for target_api_client in self._target_api_clients if target_api_client.client_id in resource_ids_by_target]
+        synchronized_targets = self._run_for_targets(loaded_target_api_clients, lambda target_api_client: self._synchronize_target(
+            target_api_client, resource_ids_by_target[target_api_client.client_id], master_unavailabilities_by_resource_id))
+        failed_targets = [target_api_client.client_id for target_api_client in self._target_api_clients if target_api_client.client_id not in synchronized_targets]
+        if failed_targets:
+            logger.error(f"Synchronisation failed for target(s) {', '.join(failed_targets)}. Other targets were synchronised.")
         logger.info("Synchronisation complete!")
 
-    def _load_resource_ids(self) -> List[UUID4]:
+    def _run_for_targets(self, target_api_clients: List[QargoAPIClient], action: Callable[[QargoAPIClient], T]) -> Dict[str, T]:
+        # Every target has its own client and session, so targets can safely be handled concurrently
+        with ThreadPoolExecutor(max_workers=max(len(target_api_clients), 1), thread_name_prefix="sync-target") as executor:
+            futures = {target_api_client.client_id: executor.submit(action, target_api_client) for target_api_client in target_api_clients}
+
+        # A failing target must not stop the other targets, so only the targets that succeeded are returned
+        results: Dict[str, T] = {}
+        for client_id, future in futures.items():
+            try:
+                results[client_id] = future.result()
+            except Exception as e:
+                logger.error(f"[{client_id}] Skipping target after error: {e}")
+        return results
+
+    def _synchronize_target(self, target_api_client: QargoAPIClient, 
+                            resource_ids: List[UUID4], 
+                            master_unavailabilities_by_resource_id: Dict[UUID4, List[Unavailability]]):
+        target = target_api_client.client_id
+        logger.info(f"[{target}] Loading target unavailabilities for {len(resource_ids)} resources...")
+        unavailability_groups_by_resource_id = self._load_unavailability_groups(target_api_client, resource_ids, master_unavailabilities_by_resource_id)
+        logger.info(f"[{target}] Finished loading target unavailabilities.")
+
+        sync_plans_by_resource_id: Dict[UUID4, UnavailabilitySyncPlan] = {}
+        for resource_id, unavailability_groups in unavailability_groups_by_resource_id.items():
+            logger.info(f"[{target}] Determining sync plan for resource {resource_id}...")
+            sync_plans_by_resource_id[resource_id] = self._determine_unavailability_sync_plan(unavailability_groups=unavailability_groups)
+
+        prioritised_operations = self._prioritise_sync_plans(sync_plans_by_resource_id)
+        retry_queue.reconcile(target, {
+            RetryOperation.build_key(target, prioritised_operation.resource_id, prioritised_operation.operation, prioritised_operation.unavailability)
+            for prioritised_operation in prioritised_operations
+        })
+        logger.info(f"[{target}] Executing {len(prioritised_operations)} sync plan actions, nearest to now first...")
+        self._execute_prioritised_operations(target_api_client, prioritised_operations)
+        logger.info(f"[{target}] Synchronisation of target complete.")
+
+    def _load_resource_ids(self, target_api_client: QargoAPIClient) -> List[UUID4]:
         try:
-            resources = target_qargo_api_client.get_resources()
+            resources = target_api_client.get_resources()
             return [resource.id for resource in resources]
         except Exception as e:
-            logging.exception(f"Failed to load resources: {e}")
+            logger.exception(f"Failed to load resources for target {target_api_client.client_id}: {e}")
             raise e
 
-    def _load_unavailabilities_for_resources(self, resource_ids: List[UUID4]) -> Dict[UUID4, UnavailabilityGroups]:
+    def _load_master_unavailabilities(self, resource_ids: List[UUID4]) -> Dict[UUID4, List[Unavailability]]:
+        try:
+            return {
+                resource_id: list(master_qargo_api_client.get_unavailabilities(resource_id, self._start_time))
+                for resource_id in resource_ids
+            }
+        except Exception as e:
+            logger.exception(f"Failed to load master unavailabilities for resources. {e}")
+            raise e
+
+    def _load_unavailability_groups(self, target_api_client: QargoAPIClient, 
+                                    resource_ids: List[UUID4], 
+                                    master_unavailabilities_by_resource_id: Dict[UUID4, List[Unavailability]]) -> Dict[UUID4, UnavailabilityGroups]:
         try:
             return {
             resource_id: (
@@ -58,13 +126,13 @@ class SynchronisationService:
                     },
                 )
             )(
-                target_qargo_api_client.get_unavailabilities(resource_id, self._start_time),
-                master_qargo_api_client.get_unavailabilities(resource_id, self._start_time),
+                list(target_api_client.get_unavailabilities(resource_id, self._start_time)),
+                master_unavailabilities_by_resource_id[resource_id],
             )
             for resource_id in resource_ids
         }
         except Exception as e:
-            logging.exception("Failed to unavailabilities for resources. {e}")
+            logger.exception(f"Failed to load unavailabilities for resources of target {target_api_client.client_id}. {e}")
             raise e
     
     def _determine_unavailability_sync_plan(self, unavailability_groups: UnavailabilityGroups) -> UnavailabilitySyncPlan:
@@ -72,7 +140,7 @@ class SynchronisationService:
         target_unavailabilities_by_external_id = unavailability_groups.target_unavailabilities_with_external_id
 
         unavailabilities_to_create: Deque[Unavailability] = Deque()
-        unavailabilities_to_update: Deque[Unavailability] = Deque()
+        unavailabilities_to_update: Deque[UnavailabilityUpdate] = Deque()
         logger.debug(f"Adding {len(unavailability_groups.target_unavailabilities_without_external_id)} target unavailabilities for deletion initially.")
         unavailabilities_to_delete: Deque[Unavailability] = Deque(unavailability_groups.target_unavailabilities_without_external_id.values())
 
@@ -90,7 +158,10 @@ class SynchronisationService:
             # If one is found but not equal, it needs to be updated and then added to the handled unavailabilities
             elif not master_unavailability.equals(target_unavailability):
                 logger.debug(f"Plan: Add UPDATE for master_unavailability_id: {master_unavailability_id} (Target ID: {target_unavailability.id})")
-                unavailabilities_to_update.append(master_unavailability.model_copy(update={"id": target_unavailability.id}))
+                # Keep the current target unavailability, so the update can be prioritised on its old times as well
+                unavailabilities_to_update.append(UnavailabilityUpdate(
+                    unavailability=master_unavailability.model_copy(update={"id": target_unavailability.id}),
+                    current_unavailability=target_unavailability))
                 handled_target_ids.add(master_unavailability_id)
             # If one is found and equal, it just needs to be added to the handled unavailabilities
             else:
@@ -120,34 +191,99 @@ class SynchronisationService:
                 to_delete=unavailabilities_to_delete,
             )
     
-    def _execute_unavailability_sync_plan_for_resource(self, resource_id: UUID4, unavailability_sync_plan: UnavailabilitySyncPlan):
-        self._create_unavailabilities_for_resource(resource_id, unavailability_sync_plan.to_create)
-        self._update_unavailabilities_for_resource(resource_id, unavailability_sync_plan.to_update)
-        self._delete_unavailabilities_for_resource(resource_id, unavailability_sync_plan.to_delete)
-
-    def _create_unavailabilities_for_resource(self, resource_id: UUID4, unavailabilities: Deque[Unavailability]):
-        failure_count: int = 0
-        for unavailability in unavailabilities:
-            if not target_qargo_api_client.create_unavailability(resource_id=resource_id, unavailability=unavailability):
-                logger.warning(f"Failed to create unavailability {unavailability} for resource {resource_id}")
-                failure_count += 1
-        if failure_count > 0:
-            logger.warning(f"Failed to create {failure_count} unavailabilities.")
-
-    def _update_unavailabilities_for_resource(self, resource_id: UUID4, unavailabilities: Deque[Unavailability]):
-        failure_count: int = 0
-        for unavailability in unavailabilities:
-            if not target_qargo_api_client.update_unavailability(resource_id=resource_id, unavailability=unavailability):
-                logger.warning(f"Failed to update unavailability {unavailability} for resource {resource_id}")
-                failure_count += 1
-        if failure_count > 0:
-            logger.warning(f"Failed to update {failure_count} unavailabilities.")
-
-    def _delete_unavailabilities_for_resource(self, resource_id: UUID4, unavailabilities: Deque[Unavailability]):
-        failure_count: int = 0
-        for unavailability in unavailabilities:
-            if not target_qargo_api_client.delete_unavailability(resource_id=resource_id, id=unavailability.id):
-                logger.warning(f"Failed to delete unavailability {unavailability} for resource {resource_id}")
-                failure_count += 1
-        if failure_count > 0:
-            logger.warning(f"Failed to delete {failure_count} unavailabilities.")
+    def _prioritise_sync_plans(self, sync_plans_by_resource_id: Dict[UUID4, UnavailabilitySyncPlan]) -> List[PrioritisedSyncOperation]:
+        now = datetime.now(timezone.utc)
+        prioritised_operations: List[PrioritisedSyncOperation] = []
+        for resource_id, sync_plan in sync_plans_by_resource_id.items():
+            prioritised_operations.extend(
+                PrioritisedSyncOperation(unavailability.distance_to(now), resource_id, SyncOperationType.CREATE, unavailability)
+                for unavailability in sync_plan.to_create)
+            # An update matters as soon as either its current or its new period is near
+            prioritised_operations.extend(
+                PrioritisedSyncOperation(
+                    min(update.current_unavailability.distance_to(now), update.unavailability.distance_to(now)),
+                    resource_id, SyncOperationType.UPDATE, update.unavailability)
+                for update in sync_plan.to_update)
+            prioritised_operations.extend(
+                PrioritisedSyncOperation(unavailability.distance_to(now), resource_id, SyncOperationType.DELETE, unavailability)
+                for unavailability in sync_plan.to_delete)
+        # Stable sort, so operations at the same distance keep the create -> update -> delete order
+        prioritised_operations.sort(key=lambda prioritised_operation: prioritised_operation.distance_to_now)
+        return prioritised_operations
+
+    def _execute_prioritised_operations(self, target_api_client: QargoAPIClient, prioritised_operations: List[PrioritisedSyncOperation]):
+        # The budget only covers executing the plan, loading time must never prevent the most urgent changes from landing
+        started_at = time.monotonic()
+        failure_counts: Dict[SyncOperationType, int] = {}
+        for index, prioritised_operation in enumerate(prioritised_operations):
+            # Changes to ongoing unavailabilities are always applied, regardless of the budget
+            if (self._time_budget 
+                and prioritised_operation.distance_to_now > timedelta(0) 
+                and time.monotonic() - started_at > self._time_budget.total_seconds()):
+                logger.warning(f"[{target_api_client.client_id}] Time budget of {self._time_budget} exceeded. Skipping {len(prioritised_operations) - index} remaining sync plan actions until the next sync.")
+                break
+            resource_id, operation, unavailability = prioritised_operation.resource_id, prioritised_operation.operation, prioritised_operation.unavailability
+            if not self._execute_operation(target_api_client, resource_id, operation, unavailability, prioritised_operation.distance_to_now):
+                logger.warning(f"[{target_api_client.client_id}] Failed to {operation.value.lower()} unavailability {unavailability} for resource {resource_id}")
+                failure_counts[operation] = failure_counts.get(operation, 0) + 1
+        for operation, failure_count in failure_counts.items():
+            logger.warning(f"[{target_api_client.client_id}] Failed to {operation.value.lower()} {failure_count} unavailabilities.")
+
+    def retry_failed_operations(self):
+        due_operations = retry_queue.due_operations()
+        if not due_operations:
+            logger.debug("No failed operations due for retry.")
+            return
+
+        due_operations.sort(key=lambda retry_operation: retry_operation.distance_to_now)
+        logger.info(f"Retrying {len(due_operations)} failed operation(s), nearest to now first...")
+        target_api_clients_by_id = {target_api_client.client_id: target_api_client for target_api_client in self._target_api_clients}
+        success_count: int = 0
+        for retry_operation in due_operations:
+            target_api_client = target_api_clients_by_id.get(retry_operation.target)
+            if not target_api_client:
+                retry_queue.dead_letter(retry_operation, reason=f"Target {retry_operation.target} is no longer configured.")
+                continue
+            # A create that timed out may still have been applied, so only replay it when the target does not have it yet
+            if retry_operation.operation == SyncOperationType.CREATE:
+                try:
+                    already_created = self._is_already_created(target_api_client, retry_operation)
+                except Exception as e:
+                    logger.exception(f"[{retry_operation.target}] Failed to check whether {retry_operation.key} was already applied: {e}")
+                    retry_queue.record_failure(retry_operation.target, retry_operation.resource_id, retry_operation.operation, retry_operation.unavailability,
+                                               distance_to_now=retry_operation.distance_to_now, reason=f"Could not check for an existing unavailability: {type(e).__name__}: {e}")
+                    continue
+                if already_created:
+                    logger.info(f"[{retry_operation.target}] {retry_operation.key} was already applied, not replaying it.")
+                    retry_queue.discard(retry_operation.target, retry_operation.resource_id, retry_operation.operation, retry_operation.unavailability)
+                    success_count += 1
+                    continue
+            if self._execute_operation(target_api_client, retry_operation.resource_id, retry_operation.operation, retry_operation.unavailability, retry_operation.distance_to_now):
+                success_count += 1
+        logger.info(f"Retried {len(due_operations)} operation(s): {success_count} succeeded, {retry_queue.pending_count()} still pending.")
+
+    def _is_already_created(self, target_api_client: QargoAPIClient, retry_operation: RetryOperation) -> bool:
+        external_id = retry_operation.unavailability.external_id
+        return any(
+            target_unavailability.external_id == external_id
+            for target_unavailability in target_api_client.get_unavailabilities(retry_operation.resource_id, self._start_time)
+        )
+
+    def _execute_operation(self, target_api_client: QargoAPIClient, resource_id: UUID4, operation: SyncOperationType, unavailability: Unavailability, distance_to_now: timedelta) -> bool:
+        match operation:
+            case SyncOperationType.CREATE:
+                write_result = target_api_client.create_unavailability(resource_id=resource_id, unavailability=unavailability)
+            case SyncOperationType.UPDATE:
+                write_result = target_api_client.update_unavailability(resource_id=resource_id, unavailability=unavailability)
+            case SyncOperationType.DELETE:
+                write_result = target_api_client.delete_unavailability(resource_id=resource_id, id=unavailability.id)
+
+        match write_result.status:
+            case WriteStatus.SUCCEEDED:
+                retry_queue.discard(target_api_client.client_id, resource_id, operation, unavailability)
+            case WriteStatus.RETRYABLE_FAILURE:
+                retry_queue.record_failure(target_api_client.client_id, resource_id, operation, unavailability, 
+                                           distance_to_now=distance_to_now, reason=write_result.failure_reason or "Unknown failure.")
+            case WriteStatus.PERMANENT_FAILURE:
+                retry_queue.record_permanent_failure(target_api_client.client_id, resource_id, operation, unavailability, reason=write_result.failure_reason or "Unknown failure.")
+        return write_result.succeeded
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from functools import wraps
 import logging
 import os
@@ -47,4 +48,8 @@ def with_exponential_backoff(
             raise last_exception
 
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+def as_utc(value: datetime) -> datetime:
+    # Naive datetimes are assumed to be UTC, matching the timezone the scheduler runs in
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)